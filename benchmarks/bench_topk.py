@@ -0,0 +1,101 @@
+"""Compare float32 top-k strategies for a single shard.
+
+    python benchmarks/bench_topk.py
+
+- library: kernels.dot_scores, then kernels.topk_indices (what search() uses
+           for float32 shards: simsimd.cdist when simsimd is installed,
+           otherwise vecs @ q through BLAS)
+- blas:    vecs @ q, then kernels.topk_indices (search() without simsimd)
+- blocked: BLAS over row tiles, pruning rows between dimension slices once
+           their Cauchy-Schwarz upper bound cannot beat the current k-th best
+"""
+import time
+
+import numpy as np
+
+from litevecdb.kernels import HAS_SIMSIMD, dot_scores, topk_indices
+
+
+def topk_library(vecs, q, k):
+    sim = dot_scores(vecs, q)
+    idx = topk_indices(sim, k)
+    return idx, sim[idx]
+
+
+def topk_blas(vecs, q, k):
+    sim = vecs @ q
+    idx = topk_indices(sim, k)
+    return idx, sim[idx]
+
+
+def topk_blocked(vecs, q, k, tile_rows=8192, n_slices=4):
+    n, d = vecs.shape
+    edges = np.linspace(0, d, n_slices + 1).astype(int)
+    # q_tail[j] = ||q[j:]||
+    q_tail = np.sqrt(np.append(np.cumsum((q * q)[::-1])[::-1], 0.0))
+    best_scores = np.empty(0, dtype=np.float32)
+    best_idx = np.empty(0, dtype=np.int64)
+    for start in range(0, n, tile_rows):
+        tile = vecs[start:start + tile_rows]
+        rows = np.arange(len(tile))
+        partial = np.zeros(len(tile), dtype=np.float32)
+        done_sq = np.zeros(len(tile), dtype=np.float32)
+        threshold = best_scores[-1] if len(best_scores) >= k else -np.inf
+        for a, b in zip(edges[:-1], edges[1:]):
+            sub = tile[rows, a:b] if len(rows) < len(tile) else tile[:, a:b]
+            partial += sub @ q[a:b]
+            if b < d and threshold > -np.inf:
+                done_sq += np.einsum('ij,ij->i', sub, sub)
+                keep = partial + np.sqrt(np.maximum(1 - done_sq, 0)) * q_tail[b] >= threshold
+                rows, partial, done_sq = rows[keep], partial[keep], done_sq[keep]
+                if not len(rows):
+                    break
+        scores = np.concatenate([best_scores, partial])
+        idx = np.concatenate([best_idx, rows + start])
+        top = np.argsort(-scores, kind='stable')[:k]
+        best_scores, best_idx = scores[top], idx[top]
+    return best_idx, best_scores
+
+
+def make_data(n, d, clustered, rng):
+    if clustered:
+        centers = rng.normal(size=(50, d))
+        vecs = centers[rng.integers(0, 50, n)] + 0.3 * rng.normal(size=(n, d))
+    else:
+        vecs = rng.normal(size=(n, d))
+    vecs = vecs.astype('float32')
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    # Near-duplicate of a stored row: the best case for pruning
+    q = vecs[7] + 0.01 * rng.normal(size=d).astype('float32')
+    return vecs, q / np.linalg.norm(q)
+
+
+def timeit_ms(fn, repeat=20):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main(k=10):
+    rng = np.random.default_rng(0)
+    print(f"library path: {'simsimd' if HAS_SIMSIMD else 'blas'}")
+    for name, n, d, clustered in [
+        ('random', 20_000, 384, False),
+        ('random', 100_000, 128, False),
+        ('clustered', 100_000, 128, True),
+    ]:
+        vecs, q = make_data(n, d, clustered, rng)
+        assert topk_blas(vecs, q, k)[0].tolist() == topk_blocked(vecs, q, k)[0].tolist()
+        library_ms = timeit_ms(lambda: topk_library(vecs, q, k))
+        blas_ms = timeit_ms(lambda: topk_blas(vecs, q, k))
+        blocked_ms = timeit_ms(lambda: topk_blocked(vecs, q, k))
+        print(
+            f"{name:9} n={n:<7} d={d:<4} library {library_ms:6.2f} ms"
+            f"  blas {blas_ms:6.2f} ms  blocked {blocked_ms:6.2f} ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,124 @@
 import os
 import time
+import atexit
+import weakref
+import functools
+import copy
 import json
+import heapq
 import pickle
+import threading
 import numpy as np
-import zstandard as zstd
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Any, Tuple
 
+from .kernels import HAS_NUMBA, HAS_SIMSIMD, dot_scores, quantize_int8, topk_indices
+
+if HAS_NUMBA:
+    from .kernels import topk_int8
+
+# Frame header of zstd-compressed legacy shards
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# HNSW graph parameters (see hnswlib docs)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+HNSW_INITIAL_CAPACITY = 1024
+
+def _flush_at_exit(db_ref):
+    # Write a still-open database's buffered rows when the interpreter exits.
+    # index.json is left alone: a newer instance may have rewritten it, and
+    # counts are recovered from the shard files on the next open.
+    db = db_ref()
+    if db is not None:
+        db._flush_append_files()
+
 class LiteVecDB:
-    def __init__(self, dim: int, dir_path='vector_store', max_shard_size_mb=5):
+    def __init__(
+        self,
+        dim: int,
+        dir_path='vector_store',
+        max_shard_size_mb=5,
+        use_hnsw=False,
+        use_quantization=False,
+        max_cache_mb=256,
+        use_fp16=False,
+        flush_every=100
+    ):
         # Initialize the vector database
         self.dim = dim
         self.dir_path = dir_path
         self.max_shard_size = max_shard_size_mb * 1024 * 1024  # MB to bytes
+        if use_quantization and use_fp16:
+            raise ValueError("use_quantization and use_fp16 are mutually exclusive.")
+        # New shards store int8 vectors with a float32 scale per row
+        self.use_quantization = use_quantization
+        # New shards store float16 vectors, halving the bytes scanned per search
+        self.use_fp16 = use_fp16
+        self.use_hnsw = use_hnsw
+        if use_hnsw:
+            try:
+                import hnswlib  # noqa: F401
+            except ImportError as e:
+                raise ImportError("use_hnsw=True requires hnswlib: pip install litevecdb[hnsw]") from e
+        # HNSW graph over all shards, built or loaded on first search
+        self._hnsw = None
+        self._hnsw_dirty = False
         os.makedirs(self.dir_path, exist_ok=True)
         self.shard_index = self._load_index()
+        # Append handles for the shard currently receiving new vectors
+        self._append_shard_id = None
+        self._vec_file = None
+        self._meta_file = None
+        self._scale_file = None
+        # Per-shard inverted index of metadata: {shard_id: {key: {value: [row, ...]}}}
+        self._meta_index = {}
+        # LRU cache of loaded shards, bounded by approximate size in bytes
+        self.max_cache_size = max_cache_mb * 1024 * 1024  # MB to bytes
+        self._shard_cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        # index.json is rewritten on flush() rather than on every mutation
+        self._dirty_index = False
+        # Rows added to the current shard but not yet written, flushed every flush_every adds
+        self.flush_every = flush_every
+        self._vec_buffer = bytearray()
+        self._meta_buffer = bytearray()
+        self._scale_buffer = bytearray()
+        self._writes_since_flush = 0
+        # Per-instance exit hook so close() can unregister just this one
+        self._exit_hook = functools.partial(_flush_at_exit, weakref.ref(self))
+        self._exit_hook_registered = False
+        self._register_exit_hook()
+        self._migrate_legacy_shards()
+        self._reconcile_counts()
+
+    def __del__(self):
+        # Write buffered rows if the instance is collected without close().
+        # The index is not rewritten here: a newer instance may own it, and
+        # counts are recovered from the shard files on the next open.
+        if getattr(self, '_exit_hook_registered', False):
+            self._unregister_exit_hook()
+            self._close_append_files()
+
+    def _register_exit_hook(self):
+        # Flush this instance at interpreter exit, until close()
+        if not self._exit_hook_registered:
+            atexit.register(self._exit_hook)
+            self._exit_hook_registered = True
+
+    def _unregister_exit_hook(self):
+        if self._exit_hook_registered:
+            atexit.unregister(self._exit_hook)
+            self._exit_hook_registered = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _index_path(self):
         # Return the path to the index file
@@ -23,59 +128,437 @@ class LiteVecDB:
         # Load shard index from file if it exists
         if os.path.exists(self._index_path()):
             with open(self._index_path(), 'r') as f:
-                return json.load(f)
-        return {'last_shard': 0, 'counts': {}}
+                index = json.load(f)
+            # Shards written before unit-norm storage are normalized lazily
+            index.setdefault('normalized', {})
+            # Shards without an entry are float32
+            index.setdefault('dtypes', {})
+            # Shards without an entry have an unknown earliest expiry and get scanned
+            index.setdefault('min_expiry', {})
+            return index
+        return self._new_index()
+
+    def _new_index(self):
+        # Index state of an empty store
+        return {'last_shard': 0, 'counts': {}, 'normalized': {}, 'dtypes': {}, 'min_expiry': {}}
 
     def _save_index(self):
-        # Save current index state to file
+        # Save current index state to file if it changed since the last save
+        if not self._dirty_index:
+            return
         with open(self._index_path(), 'w') as f:
             json.dump(self.shard_index, f)
+        self._dirty_index = False
+
+    def _reconcile_counts(self):
+        # Recover row counts of shards whose adds were never flushed to index.json
+        for shard_id in range(self.shard_index['last_shard'] + 1):
+            vec_path = self._get_vec_path(shard_id)
+            if not os.path.exists(vec_path):
+                continue
+            row_bytes = self.dim * self._shard_dtype(shard_id).itemsize
+            recorded = self.shard_index['counts'].get(str(shard_id), 0)
+            # Only the last shard receives appends, so any other shard that matches its count is intact
+            if shard_id != self.shard_index['last_shard'] and os.path.getsize(vec_path) == recorded * row_bytes:
+                continue
+
+            # An interrupted flush can leave the files with different row counts;
+            # keep only the rows present in all of them
+            count = os.path.getsize(vec_path) // row_bytes
+            meta_path = self._get_meta_path(shard_id)
+            meta_ends = []
+            if os.path.exists(meta_path):
+                with open(meta_path, 'rb') as f:
+                    data = f.read()
+                meta_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+            count = min(count, len(meta_ends))
+            scale_path = self._get_scale_path(shard_id)
+            if self._shard_dtype(shard_id) == np.int8:
+                scale_rows = os.path.getsize(scale_path) // 4 if os.path.exists(scale_path) else 0
+                count = min(count, scale_rows)
+                if os.path.exists(scale_path):
+                    os.truncate(scale_path, count * 4)
+            os.truncate(vec_path, count * row_bytes)
+            if os.path.exists(meta_path):
+                os.truncate(meta_path, int(meta_ends[count - 1]) if count else 0)
+
+            if count != recorded:
+                self.shard_index['counts'][str(shard_id)] = count
+                # Unflushed rows may expire earlier than the recorded minimum
+                self.shard_index['min_expiry'].pop(str(shard_id), None)
+                self._dirty_index = True
 
-    def _get_shard_path(self, shard_id):
-        # Construct the path to a specific shard file
+    def _get_legacy_shard_path(self, shard_id):
+        # Path of a shard written by the old pickle + zstd format
         return os.path.join(self.dir_path, f'shard_{shard_id}.pkl.zst')
 
-    def _load_shard(self, shard_id):
-        # Load and decompress a shard file using Zstandard
-        path = self._get_shard_path(shard_id)
-        if os.path.exists(path):
-            dctx = zstd.ZstdDecompressor()
+    def _migrate_legacy_shards(self):
+        # Convert old .pkl.zst shards to the uncompressed binary format, once
+        for shard_id in range(self.shard_index['last_shard'] + 1):
+            path = self._get_legacy_shard_path(shard_id)
+            if not os.path.exists(path):
+                continue
             with open(path, 'rb') as f:
-                with dctx.stream_reader(f) as decompressor:
-                    return pickle.load(decompressor)
-        return {'vectors': [], 'metadata': []}
+                if f.read(4) != ZSTD_MAGIC:
+                    raise ValueError(f"Unrecognized legacy shard format: {path}")
+                try:
+                    import zstandard as zstd
+                except ImportError as e:
+                    raise ImportError(
+                        "Migrating .pkl.zst shards requires zstandard: pip install litevecdb[legacy]"
+                    ) from e
+                f.seek(0)
+                with zstd.ZstdDecompressor().stream_reader(f) as decompressor:
+                    shard_data = pickle.load(decompressor)
+            self._save_shard(shard_id, shard_data)
+            os.remove(path)
+
+    def _get_vec_path(self, shard_id):
+        # Construct the path to a shard's raw vector file
+        return os.path.join(self.dir_path, f'shard_{shard_id}.vec')
+
+    def _get_scale_path(self, shard_id):
+        # Construct the path to a quantized shard's per-row float32 scales
+        return os.path.join(self.dir_path, f'shard_{shard_id}.scale')
+
+    def _shard_dtype(self, shard_id) -> np.dtype:
+        # Storage dtype of a shard's vector file
+        return np.dtype(self.shard_index['dtypes'].get(str(shard_id), 'float32'))
+
+    def _get_meta_path(self, shard_id):
+        # Construct the path to a shard's metadata sidecar
+        return os.path.join(self.dir_path, f'shard_{shard_id}.meta.jsonl')
+
+    def _load_vectors(self, shard_id) -> np.ndarray:
+        # Memory-map a shard's vectors as a C-contiguous (N, dim) array of its storage dtype
+        path = self._get_vec_path(shard_id)
+        dtype = self._shard_dtype(shard_id)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty((0, self.dim), dtype=dtype)
+        # Plain ndarray view of the mapping: matmul goes straight to BLAS without memmap wrapping
+        return np.asarray(np.memmap(path, dtype=dtype, mode='r')).reshape(-1, self.dim)
+
+    def _load_scales(self, shard_id):
+        # Memory-map a quantized shard's scales; None for float shards
+        if self._shard_dtype(shard_id) != np.int8:
+            return None
+        path = self._get_scale_path(shard_id)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype='float32')
+        return np.asarray(np.memmap(path, dtype='float32', mode='r'))
+
+    def _load_metadata(self, shard_id) -> list:
+        # Load a shard's metadata list from its JSONL sidecar
+        self._sync_shard(shard_id)
+        path = self._get_meta_path(shard_id)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        return []
+
+    def _normalize_shard(self, shard_id):
+        # Rescale a shard's stored vectors to unit length in place, once
+        if self.shard_index['normalized'].get(str(shard_id)):
+            return
+        path = self._get_vec_path(shard_id)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            vectors = np.memmap(path, dtype='float32', mode='r+').reshape(-1, self.dim)
+            # Row norms without an (N, dim) temporary of squares
+            norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors, optimize=True))
+            norms[norms == 0] = 1.0
+            vectors /= norms[:, None]
+            vectors.flush()
+            del vectors
+        self.shard_index['normalized'][str(shard_id)] = True
+        self._dirty_index = True
+
+    def _load_shard(self, shard_id):
+        # Load a shard as a vector matrix, its scales (int8 shards only) and a metadata list
+        self._sync_shard(shard_id)
+        self._normalize_shard(shard_id)
+        with self._cache_lock:
+            if shard_id in self._shard_cache:
+                self._shard_cache.move_to_end(shard_id)
+                return dict(self._shard_cache[shard_id][0])
+
+        shard_data = {
+            'vectors': self._load_vectors(shard_id),
+            'scales': self._load_scales(shard_id),
+            'metadata': self._load_metadata(shard_id)
+        }
+        self._cache_shard(shard_id, shard_data)
+        return dict(shard_data)
+
+    def _cache_shard(self, shard_id, shard_data):
+        # Insert a loaded shard into the LRU cache, evicting the oldest entries
+        size = shard_data['vectors'].nbytes
+        if shard_data['scales'] is not None:
+            size += shard_data['scales'].nbytes
+        meta_path = self._get_meta_path(shard_id)
+        if os.path.exists(meta_path):
+            size += os.path.getsize(meta_path)
+        if size > self.max_cache_size:
+            return
+
+        with self._cache_lock:
+            self._uncache_shard_locked(shard_id)
+            self._shard_cache[shard_id] = (shard_data, size)
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_cache_size:
+                _, (_, evicted_size) = self._shard_cache.popitem(last=False)
+                self._cache_bytes -= evicted_size
+
+    def _uncache_shard(self, shard_id):
+        # Drop a shard from the LRU cache after it changes on disk
+        with self._cache_lock:
+            self._uncache_shard_locked(shard_id)
+
+    def _uncache_shard_locked(self, shard_id):
+        if shard_id in self._shard_cache:
+            _, size = self._shard_cache.pop(shard_id)
+            self._cache_bytes -= size
+
+    def _float_vectors(self, shard_data) -> np.ndarray:
+        # A shard's vectors as float32, dequantizing int8 shards
+        if shard_data.get('scales') is None:
+            return np.asarray(shard_data['vectors'], dtype='float32')
+        return shard_data['vectors'].astype('float32') * shard_data['scales'][:, None]
 
     def _save_shard(self, shard_id, shard_data):
-        # Compress and save a shard to disk
-        path = self._get_shard_path(shard_id)
-        cctx = zstd.ZstdCompressor(level=3) # Compression level (1–22)
-        with open(path, 'wb') as f:
-            with cctx.stream_writer(f) as compressor:
-                pickle.dump(shard_data, compressor)
+        # Rewrite a shard's vector file and metadata sidecar
+        self._meta_index.pop(shard_id, None)
+        self._uncache_shard(shard_id)
+        if shard_id == self._append_shard_id:
+            # Append handles would keep writing to the replaced files
+            self._close_append_files()
+        vec_path = self._get_vec_path(shard_id)
+        meta_path = self._get_meta_path(shard_id)
+        dtype = self._shard_dtype(shard_id)
+        # Write to temp files and swap them in so live memmaps of the old file stay valid
+        np.asarray(shard_data['vectors'], dtype=dtype).reshape(-1, self.dim).tofile(vec_path + '.tmp')
+        with open(meta_path + '.tmp', 'w') as f:
+            for meta in shard_data['metadata']:
+                f.write(json.dumps(meta) + '\n')
+        if dtype == np.int8:
+            scale_path = self._get_scale_path(shard_id)
+            np.asarray(shard_data['scales'], dtype='float32').tofile(scale_path + '.tmp')
+            os.replace(scale_path + '.tmp', scale_path)
+        os.replace(vec_path + '.tmp', vec_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _open_append_files(self, shard_id):
+        # Open (or reuse) append-only handles for a shard's vector and metadata files
+        if self._append_shard_id != shard_id:
+            self._close_append_files()
+            self._vec_file = open(self._get_vec_path(shard_id), 'ab')
+            self._meta_file = open(self._get_meta_path(shard_id), 'ab')
+            if self._shard_dtype(shard_id) == np.int8:
+                self._scale_file = open(self._get_scale_path(shard_id), 'ab')
+            self._append_shard_id = shard_id
+            # Re-arm the exit flush if the instance is reused after close()
+            self._register_exit_hook()
+        return self._vec_file, self._meta_file, self._scale_file
+
+    def _flush_append_files(self):
+        # Write rows buffered for the current shard to its files
+        if self._writes_since_flush == 0:
+            return
+        for f, buffer in (
+            (self._vec_file, self._vec_buffer),
+            (self._meta_file, self._meta_buffer),
+            (self._scale_file, self._scale_buffer)
+        ):
+            if f is not None and buffer:
+                f.write(buffer)
+                f.flush()
+            buffer.clear()
+        self._writes_since_flush = 0
+
+    def _stored_rows(self, shard_id):
+        # Rows in a shard's vector file plus rows still buffered for it
+        path = self._get_vec_path(shard_id)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if shard_id == self._append_shard_id:
+            size += len(self._vec_buffer)
+        return size // (self.dim * self._shard_dtype(shard_id).itemsize)
+
+    def _resync_shard(self, shard_id, count):
+        # Adopt a row count that changed on disk behind this instance's back
+        self.shard_index['counts'][str(shard_id)] = count
+        # The unseen rows may expire earlier than the recorded minimum
+        self.shard_index['min_expiry'].pop(str(shard_id), None)
+        self._dirty_index = True
+        self._meta_index.pop(shard_id, None)
+        self._uncache_shard(shard_id)
+        # The graph lacks the unseen rows; it is reloaded or rebuilt on the next search
+        self._hnsw = None
+        self._hnsw_dirty = False
+
+    def _sync_shard(self, shard_id):
+        # Make buffered rows visible before a shard is read from disk
+        if shard_id == self._append_shard_id:
+            self._flush_append_files()
+
+    def _close_append_files(self):
+        # Flush and close the cached append handles, if any
+        self._flush_append_files()
+        for f in (self._vec_file, self._meta_file, self._scale_file):
+            if f is not None:
+                f.close()
+        self._append_shard_id = None
+        self._vec_file = None
+        self._meta_file = None
+        self._scale_file = None
+
+    def _hnsw_path(self):
+        # Return the path to the persisted HNSW graph
+        return os.path.join(self.dir_path, 'hnsw.bin')
+
+    def _hnsw_label(self, shard_id, index):
+        # Encode a vector's location as its HNSW label
+        return (shard_id << 32) | index
+
+    def _get_hnsw(self):
+        # Load the persisted HNSW graph, or rebuild it from the shards
+        if self._hnsw is not None:
+            return self._hnsw
+        import hnswlib
+
+        total = sum(self.shard_index['counts'].values())
+        index = hnswlib.Index(space='cosine', dim=self.dim)
+        path = self._hnsw_path()
+        if os.path.exists(path):
+            index.load_index(path, max_elements=max(total, HNSW_INITIAL_CAPACITY))
+            if index.get_current_count() == total:
+                self._hnsw = index
+                return index
+            index = hnswlib.Index(space='cosine', dim=self.dim)
+
+        index.init_index(
+            max_elements=max(total, HNSW_INITIAL_CAPACITY),
+            M=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION
+        )
+        for shard_id in range(self.shard_index['last_shard'] + 1):
+            vectors = self._float_vectors(self._load_shard(shard_id))
+            if len(vectors):
+                labels = [self._hnsw_label(shard_id, i) for i in range(len(vectors))]
+                index.add_items(vectors, labels)
+        self._hnsw = index
+        self._hnsw_dirty = True
+        return index
+
+    def _save_hnsw(self):
+        # Persist the HNSW graph if it changed since the last save
+        if self._hnsw is not None and self._hnsw_dirty:
+            self._hnsw.save_index(self._hnsw_path())
+            self._hnsw_dirty = False
+
+    def _drop_hnsw(self):
+        # Discard the HNSW graph; deletes shift row offsets, so labels go stale
+        self._hnsw = None
+        self._hnsw_dirty = False
+        if os.path.exists(self._hnsw_path()):
+            os.remove(self._hnsw_path())
+
+    def flush(self):
+        # Write buffered rows, then persist the index and HNSW graph if they changed
+        self._flush_append_files()
+        self._save_index()
+        self._save_hnsw()
+
+    def close(self):
+        # Flush pending state and release open file handles
+        self.flush()
+        self._close_append_files()
+        self._unregister_exit_hook()
 
     def add(self, vector: List[float], meta: Any):
-        # Add a new vector and metadata to the latest shard
+        # Append a new vector and metadata to the latest shard
         shard_id = self.shard_index['last_shard']
-        shard_data = self._load_shard(shard_id)
 
         # Check that the vector matches the expected dimension
         if len(vector) != self.dim:
             raise ValueError(f"Vector dimension mismatch: expected {self.dim}, got {len(vector)}")
 
-        shard_data['vectors'].append(vector)
-        shard_data['metadata'].append(meta)
-        self._save_shard(shard_id, shard_data)
+        # Store unit vectors so cosine similarity is a plain dot product
+        vec = np.array(vector, dtype='float32')
+        norm = np.sqrt(np.vdot(vec, vec))
+        if norm > 0:
+            vec /= norm
+        self._normalize_shard(shard_id)
 
-        # Check if the shard has reached the maximum size
-        shard_path = self._get_shard_path(shard_id)
-        file_size = os.path.getsize(shard_path)
+        # Another instance may have appended rows since the index was read, so
+        # the new row's position comes from the shard files rather than counts
+        stored = self._stored_rows(shard_id)
+        if stored != self.shard_index['counts'].get(str(shard_id), 0):
+            self._resync_shard(shard_id, stored)
 
-        if file_size >= self.max_shard_size:
-            self.shard_index['last_shard'] = shard_id + 1
+        # An empty shard takes the storage dtype currently configured
+        if not stored:
+            self.shard_index['min_expiry'][str(shard_id)] = None
+            if self.use_quantization:
+                self.shard_index['dtypes'][str(shard_id)] = 'int8'
+            elif self.use_fp16:
+                self.shard_index['dtypes'][str(shard_id)] = 'float16'
+            else:
+                self.shard_index['dtypes'].pop(str(shard_id), None)
+            # Persist the dtype before any rows land; counts are recovered from file sizes
+            self._dirty_index = True
+            self._save_index()
 
-        # Update index count and save
-        self.shard_index['counts'][str(shard_id)] = len(shard_data['vectors'])
-        self._save_index()
+        # Serialize first so a bad record never leaves a half-written row
+        scale_bytes = None
+        if self._shard_dtype(shard_id) == np.int8:
+            quantized, scale = quantize_int8(vec)
+            vec_bytes = quantized.tobytes()
+            scale_bytes = scale.tobytes()
+        else:
+            vec_bytes = vec.astype(self._shard_dtype(shard_id)).tobytes()
+        meta_bytes = (json.dumps(meta) + '\n').encode('utf-8')
+
+        # Buffer the row in memory; it reaches the shard files on the next flush
+        vec_file, meta_file, scale_file = self._open_append_files(shard_id)
+        self._vec_buffer += vec_bytes
+        self._meta_buffer += meta_bytes
+        if scale_bytes is not None:
+            self._scale_buffer += scale_bytes
+        self._writes_since_flush += 1
+
+        # Cached memmaps have a fixed length, so the next load remaps the shard
+        self._uncache_shard(shard_id)
+
+        # Update index count
+        count = stored + 1
+        self.shard_index['counts'][str(shard_id)] = count
+        self._dirty_index = True
+
+        if shard_id in self._meta_index:
+            self._index_meta(self._meta_index[shard_id], count - 1, meta)
+
+        if str(shard_id) in self.shard_index['min_expiry']:
+            self.shard_index['min_expiry'][str(shard_id)] = self._min_expiry(
+                [self.shard_index['min_expiry'][str(shard_id)], self._expires_at(meta)]
+            )
+
+        if self._hnsw is not None:
+            if self._hnsw.get_current_count() >= self._hnsw.get_max_elements():
+                self._hnsw.resize_index(self._hnsw.get_max_elements() * 2)
+            self._hnsw.add_items(vec[None, :], [self._hnsw_label(shard_id, count - 1)])
+            self._hnsw_dirty = True
+
+        # Check if the shard has reached the maximum size
+        shard_size = sum(
+            os.fstat(f.fileno()).st_size for f in (vec_file, meta_file, scale_file) if f is not None
+        ) + len(self._vec_buffer) + len(self._meta_buffer) + len(self._scale_buffer)
+        if shard_size >= self.max_shard_size:
+            self.shard_index['last_shard'] = shard_id + 1
+            self._close_append_files()
+            self._save_index()
+        elif self._writes_since_flush >= self.flush_every:
+            # Rows and index only; the HNSW graph is rewritten in full, so leave it to flush()/close()
+            self._flush_append_files()
+            self._save_index()
 
     def search(
         self,
@@ -88,113 +571,241 @@ class LiteVecDB:
         if metric != "cosine":
             raise ValueError("Only 'cosine' metric is supported in this version.")
     
-        all_results = []
         query_np = np.array(query, dtype='float32')
+        query_norm = np.sqrt(np.vdot(query_np, query_np))
+        if query_norm > 0:
+            query_np /= query_norm
+
+        # Filtered queries stay exact; the graph cannot prune by metadata
+        if self.use_hnsw and not filters:
+            return self._search_hnsw(query_np, k)
+        return self._search_flat(query_np, k, filters)
+
+    def _search_flat(self, query_np: np.ndarray, k: int, filters: dict = None):
+        # Brute-force scan of every shard, loading and scoring shards in parallel
+        shard_ids = range(self.shard_index['last_shard'] + 1)
+        # Write buffered rows here so workers never touch the append handles
+        self._flush_append_files()
+        # Lazy normalization writes the index, so do it here rather than in workers
+        for shard_id in shard_ids:
+            self._normalize_shard(shard_id)
+
+        if len(shard_ids) > 1:
+            max_workers = min(os.cpu_count() or 1, len(shard_ids))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                per_shard = list(executor.map(
+                    lambda shard_id: self._search_shard(shard_id, query_np, k, filters),
+                    shard_ids
+                ))
+        else:
+            per_shard = [self._search_shard(shard_id, query_np, k, filters) for shard_id in shard_ids]
+        all_results = [result for results in per_shard for result in results]
     
-        for shard_id in range(self.shard_index['last_shard'] + 1):
-            shard_data = self._load_shard(shard_id)
-            if not shard_data['vectors']:
-                continue
-    
-            # Include index to track location in shard
-            filtered = [
-                (i, vec, meta)
-                for i, (vec, meta) in enumerate(zip(shard_data['vectors'], shard_data['metadata']))
-                if not filters or self._match_filter(meta, filters)
-            ]
-    
-            if not filtered:
-                continue
-    
-            vecs_filtered = np.array([x[1] for x in filtered], dtype='float32')
-            metas_filtered = [x[2] for x in filtered]
-            indices_filtered = [x[0] for x in filtered]
-    
-            # Calculate cosine similarity
-            sim = self._cosine_similarity(vecs_filtered, query_np)
-            top_k_idx = sim.argsort()[::-1][:k]
-    
-            for i in top_k_idx:
-                all_results.append(
-                    (float(sim[i]), metas_filtered[i], shard_id, indices_filtered[i])
-                )
-    
-        # Sort all results by similarity score and return top-k
-        all_results.sort(key=lambda x: x[0], reverse=True)
-        return all_results[:k]
+        # Merge per-shard candidates into the global top-k with a bounded heap
+        return heapq.nlargest(k, all_results, key=lambda x: x[0])
+
+    def _search_shard(self, shard_id, query_np: np.ndarray, k: int, filters: dict = None):
+        # Top-k candidates of a single shard
+        shard_data = self._load_shard(shard_id)
+        vectors = shard_data['vectors']
+        scales = shard_data['scales']
+        metadata = shard_data['metadata']
+        if not metadata:
+            return []
+
+        # Include index to track location in shard
+        if filters:
+            indices = self._filter_rows(shard_id, metadata, filters)
+            if not len(indices):
+                return []
+            vecs_filtered = vectors[indices]
+            if scales is not None:
+                scales = scales[indices]
+        else:
+            indices = np.arange(len(metadata))
+            vecs_filtered = vectors
+
+        # Stored vectors are unit length, so cosine similarity is a dot product
+        if scales is not None:
+            # int8 dot products accumulate in int32, then rescale per row
+            query_q, query_scale = quantize_int8(query_np)
+            # SimSIMD's int8 dot beats the fused Numba kernel; use the latter only without it
+            if HAS_NUMBA and not HAS_SIMSIMD:
+                top_k_idx, top_k_sim = topk_int8(vecs_filtered, scales, query_q, float(query_scale), k)
+            else:
+                sim = dot_scores(vecs_filtered, query_q) * (scales * query_scale)
+                top_k_idx = topk_indices(sim, k)
+                top_k_sim = sim[top_k_idx]
+        else:
+            sim = dot_scores(vecs_filtered, query_np)
+            top_k_idx = topk_indices(sim, k)
+            top_k_sim = sim[top_k_idx]
+
+        results = []
+        for i, score in zip(top_k_idx, top_k_sim):
+            index = int(indices[i])
+            # Cached metadata is shared; callers get their own copy
+            results.append((float(score), copy.deepcopy(metadata[index]), shard_id, index))
+        return results
+
+    def _search_hnsw(self, query_np: np.ndarray, k: int):
+        # Approximate search over the HNSW graph
+        index = self._get_hnsw()
+        n = index.get_current_count()
+        if n == 0 or k <= 0:
+            return []
+        index.set_ef(max(HNSW_EF_SEARCH, k))
+        labels, distances = index.knn_query(query_np, k=min(k, n))
+
+        results = []
+        metadata_by_shard = {}
+        for label, distance in zip(labels[0], distances[0]):
+            shard_id, index_in_shard = int(label) >> 32, int(label) & 0xFFFFFFFF
+            if shard_id not in metadata_by_shard:
+                metadata_by_shard[shard_id] = self._load_metadata(shard_id)
+            meta = metadata_by_shard[shard_id][index_in_shard]
+            results.append((1.0 - float(distance), meta, shard_id, index_in_shard))
+        return results
 
     def get_all(self) -> list:
         # Retrieve all vectors and metadata from all shards
         results = []
         for shard_id in range(self.shard_index['last_shard'] + 1):
             shard_data = self._load_shard(shard_id)
-            for i in range(len(shard_data['vectors'])):
+            if not shard_data['metadata']:
+                continue
+            # One bulk conversion of the vector matrix instead of one per row
+            vectors = self._float_vectors(shard_data).tolist()
+            for i, (vector, meta) in enumerate(zip(vectors, shard_data['metadata'])):
                 results.append({
                     'shard': shard_id,
                     'index': i,
-                    'vector': shard_data['vectors'][i],
-                    'metadata': shard_data['metadata'][i]
+                    'vector': vector,
+                    'metadata': copy.deepcopy(meta)
                 })
         return results
 
     def delete(self, shard_id: int, index: int):
         # Delete a specific vector and its metadata from a shard
+        if shard_id < 0 or shard_id > self.shard_index['last_shard']:
+            raise IndexError("Shard out of range")
         shard_data = self._load_shard(shard_id)
-        if index < 0 or index >= len(shard_data['vectors']):
+        if index < 0 or index >= len(shard_data['metadata']):
             raise IndexError("Index out of range")
-        del shard_data['vectors'][index]
-        del shard_data['metadata'][index]
+        shard_data['vectors'] = np.delete(shard_data['vectors'], index, axis=0)
+        if shard_data['scales'] is not None:
+            shard_data['scales'] = np.delete(shard_data['scales'], index)
+        # Build a new list; the loaded one may be shared with the shard cache
+        shard_data['metadata'] = shard_data['metadata'][:index] + shard_data['metadata'][index + 1:]
         self._save_shard(shard_id, shard_data)
-        self.shard_index['counts'][str(shard_id)] = len(shard_data['vectors'])
-        self._save_index()
+        self._drop_hnsw()
+        self.shard_index['counts'][str(shard_id)] = len(shard_data['metadata'])
+        self._dirty_index = True
 
     def delete_all(self):
         # Delete all shards and reset the index
-        for shard_id in range(self.shard_index['last_shard'] + 1):
-            path = self._get_shard_path(shard_id)
-            if os.path.exists(path):
-                os.remove(path)
+        for buffer in (self._vec_buffer, self._meta_buffer, self._scale_buffer):
+            buffer.clear()
+        self._writes_since_flush = 0
+        self._close_append_files()
+        self._meta_index = {}
+        with self._cache_lock:
+            self._shard_cache.clear()
+            self._cache_bytes = 0
+        self._drop_hnsw()
+        # Remove every shard file, including any beyond a stale last_shard
+        for name in os.listdir(self.dir_path):
+            if name.startswith('shard_'):
+                os.remove(os.path.join(self.dir_path, name))
     
         index_path = self._index_path()
         if os.path.exists(index_path):
             os.remove(index_path)
     
-        self.shard_index = {'last_shard': 0, 'counts': {}}
+        self.shard_index = self._new_index()
 
     def purge_expired(self):
         # Remove all expired vectors based on metadata expiration timestamp
         purged_count = 0
+        now = time.time()
+        min_expiry = self.shard_index['min_expiry']
     
         for shard_id in range(self.shard_index['last_shard'] + 1):
+            # Skip shards whose earliest expiry is known and still in the future
+            if str(shard_id) in min_expiry and (
+                min_expiry[str(shard_id)] is None or min_expiry[str(shard_id)] > now
+            ):
+                continue
+
             shard_data = self._load_shard(shard_id)
-            if not shard_data['vectors']:
+            if not shard_data['metadata']:
+                min_expiry[str(shard_id)] = None
                 continue
     
-            new_vectors = []
-            new_metadata = []
+            keep = np.array([not self._is_expired(meta) for meta in shard_data['metadata']], dtype=bool)
+            purged_count += int((~keep).sum())
     
-            for vec, meta in zip(shard_data['vectors'], shard_data['metadata']):
-                if not self._is_expired(meta):
-                    new_vectors.append(vec)
-                    new_metadata.append(meta)
-                else:
-                    purged_count += 1
-    
-            if len(new_vectors) != len(shard_data['vectors']):
-                shard_data['vectors'] = new_vectors
-                shard_data['metadata'] = new_metadata
+            if not keep.all():
+                shard_data['vectors'] = shard_data['vectors'][keep]
+                if shard_data['scales'] is not None:
+                    shard_data['scales'] = shard_data['scales'][keep]
+                shard_data['metadata'] = [
+                    meta for meta, kept in zip(shard_data['metadata'], keep) if kept
+                ]
                 self._save_shard(shard_id, shard_data)
+                self._drop_hnsw()
     
-            self.shard_index['counts'][str(shard_id)] = len(new_vectors)
+            self.shard_index['counts'][str(shard_id)] = len(shard_data['metadata'])
+            min_expiry[str(shard_id)] = self._min_expiry(
+                [self._expires_at(meta) for meta in shard_data['metadata']]
+            )
     
-        self._save_index()
+        self._dirty_index = True
         print(f"Purged {purged_count} expired items.")
 
-    def _cosine_similarity(self, vecs: np.ndarray, query: np.ndarray) -> np.ndarray:
-        # Calculate cosine similarity between vectors and a query vector
-        vecs_norm = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
-        query_norm = query / np.linalg.norm(query)
-        return np.dot(vecs_norm, query_norm)
+    def _index_meta(self, meta_index: dict, row: int, meta: Any):
+        # Add one row's hashable metadata values to a shard's inverted index
+        if not isinstance(meta, dict):
+            return
+        for key, value in meta.items():
+            try:
+                meta_index.setdefault(key, {}).setdefault(value, []).append(row)
+            except TypeError:
+                # Unhashable values (lists, dicts) are only matched by a scan
+                continue
+
+    def _get_meta_index(self, shard_id, metadata: list) -> dict:
+        # Build a shard's inverted metadata index on first use
+        if shard_id not in self._meta_index:
+            meta_index = {}
+            for row, meta in enumerate(metadata):
+                self._index_meta(meta_index, row, meta)
+            self._meta_index[shard_id] = meta_index
+        return self._meta_index[shard_id]
+
+    def _filter_rows(self, shard_id, metadata: list, filters: dict) -> np.ndarray:
+        # Rows of a shard matching all filters, by intersecting posting lists
+        try:
+            hash(tuple(filters.values()))
+            indexable = None not in filters.values()
+        except TypeError:
+            indexable = False
+        if not indexable:
+            # None also matches missing keys and unhashable values need ==, so scan
+            return np.array(
+                [i for i, meta in enumerate(metadata) if self._match_filter(meta, filters)],
+                dtype=np.int64
+            )
+
+        meta_index = self._get_meta_index(shard_id, metadata)
+        rows = None
+        for key, expected_value in filters.items():
+            postings = meta_index.get(key, {}).get(expected_value)
+            if not postings:
+                return np.empty(0, dtype=np.int64)
+            postings = np.array(postings, dtype=np.int64)
+            rows = postings if rows is None else np.intersect1d(rows, postings, assume_unique=True)
+        return rows
 
     def _match_filter(self, meta: dict, filters: dict) -> bool:
         # Check if metadata matches the provided filters
@@ -203,6 +814,15 @@ class LiteVecDB:
                 return False
         return True
 
+    def _expires_at(self, meta: dict):
+        # Expiration timestamp of a row, or None if it never expires
+        return meta.get("expires_at") if isinstance(meta, dict) else None
+
+    def _min_expiry(self, expiries: list):
+        # Earliest of the given expiration timestamps, or None if none expire
+        expiries = [expires_at for expires_at in expiries if expires_at is not None]
+        return min(expiries) if expiries else None
+
     def _is_expired(self, meta: dict) -> bool:
         # Check if the metadata indicates that the item is expired
         expires_at = meta.get("expires_at")
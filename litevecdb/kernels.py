@@ -0,0 +1,89 @@
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+try:
+    import simsimd
+    HAS_SIMSIMD = True
+except ImportError:
+    HAS_SIMSIMD = False
+
+
+def quantize_int8(vectors: np.ndarray):
+    # Symmetric int8 quantization with one float32 scale per row (or per 1-D vector)
+    vectors = np.asarray(vectors, dtype='float32')
+    scales = np.abs(vectors).max(axis=-1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales).astype(np.int8)
+    return quantized, scales[..., 0].astype('float32')
+
+
+def dot_scores(vecs: np.ndarray, q: np.ndarray) -> np.ndarray:
+    # Dot product of every row with q; int8 inputs accumulate in int32, float16 in float32
+    if HAS_SIMSIMD and len(vecs):
+        # SIMD kernels (AVX2/AVX-512/NEON) with no widened copy of int8/float16 rows
+        return np.asarray(simsimd.cdist(q[None, :].astype(vecs.dtype), vecs, metric='dot'))[0]
+    if vecs.dtype == np.int8:
+        return vecs.astype(np.int32) @ q.astype(np.int32)
+    if vecs.dtype == np.float16:
+        return vecs.astype(np.float32) @ q.astype(np.float32)
+    return vecs @ q
+
+
+def topk_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k largest scores, best first, via a partial sort
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+if HAS_NUMBA:
+    @njit(cache=True, nogil=True)
+    def _sift_down(scores, indices, pos):
+        # Restore the min-heap property below pos
+        k = scores.shape[0]
+        while True:
+            smallest = pos
+            left = 2 * pos + 1
+            right = left + 1
+            if left < k and scores[left] < scores[smallest]:
+                smallest = left
+            if right < k and scores[right] < scores[smallest]:
+                smallest = right
+            if smallest == pos:
+                return
+            scores[pos], scores[smallest] = scores[smallest], scores[pos]
+            indices[pos], indices[smallest] = indices[smallest], indices[pos]
+            pos = smallest
+
+    @njit(cache=True, nogil=True)
+    def topk_int8(vecs, scales, q, q_scale, k):
+        # Top-k rescaled int8 dot products in one pass, with no (N, d) int32 temporary
+        n, d = vecs.shape
+        k = max(min(k, n), 0)
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        heap_scores = np.full(k, -np.inf)
+        heap_indices = np.full(k, -1, dtype=np.int64)
+
+        for i in range(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(vecs[i, j]) * np.int32(q[j])
+            score = acc * np.float64(scales[i]) * q_scale
+            if score > heap_scores[0]:
+                heap_scores[0] = score
+                heap_indices[0] = i
+                _sift_down(heap_scores, heap_indices, 0)
+
+        order = np.argsort(-heap_scores)
+        return heap_indices[order], heap_scores[order]
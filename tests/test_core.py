@@ -1,4 +1,9 @@
 from litevecdb import LiteVecDB
+import numpy as np
+import os
+import json
+import pickle
+import pytest
 import time
 
 def test_add_and_search():
@@ -78,4 +83,425 @@ def test_delete_all_data():
 
     assert db.get_all() == []
     assert db.shard_index["counts"] == {}
-    assert db.shard_index["last_shard"] == 0
\ No newline at end of file
+    assert db.shard_index["last_shard"] == 0
+
+def test_shard_stored_as_raw_float32():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+    db.flush()
+
+    vectors = np.fromfile(db._get_vec_path(0), dtype="float32").reshape(-1, 3)
+    expected = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    assert np.allclose(vectors, expected / np.linalg.norm(expected, axis=1, keepdims=True))
+    assert db._load_metadata(0) == [{"text": "sample1"}, {"text": "sample2"}]
+
+def test_migrate_legacy_zstd_shard():
+    zstd = pytest.importorskip("zstandard")
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    legacy = {"vectors": [[1.0, 2.0, 3.0]], "metadata": [{"text": "legacy"}]}
+    with open(db._get_legacy_shard_path(0), "wb") as f:
+        with zstd.ZstdCompressor(level=3).stream_writer(f) as compressor:
+            pickle.dump(legacy, compressor)
+
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    assert not os.path.exists(db._get_legacy_shard_path(0))
+    assert db.get_all()[0]["metadata"] == {"text": "legacy"}
+    assert np.allclose(db.get_all()[0]["vector"], np.array([1.0, 2.0, 3.0]) / np.sqrt(14.0))
+
+def test_add_appends_without_rewriting():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.flush()
+    inode = os.stat(db._get_vec_path(0)).st_ino
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+    db.flush()
+
+    assert os.stat(db._get_vec_path(0)).st_ino == inode
+    assert os.path.getsize(db._get_vec_path(0)) == 2 * 3 * 4
+    with open(db._get_meta_path(0)) as f:
+        assert len(f.readlines()) == 2
+    assert db.shard_index["counts"]["0"] == 2
+    db.close()
+
+def test_vectors_normalized_on_insert():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([3.0, 0.0, 4.0], {"text": "sample"})
+
+    stored = np.asarray(db._load_shard(0)["vectors"])
+    assert np.allclose(np.linalg.norm(stored, axis=1), 1.0)
+    score, meta, _, _ = db.search([6.0, 0.0, 8.0], k=1)[0]
+    assert score == pytest.approx(1.0)
+
+def test_unnormalized_shard_migrated_lazily():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db._save_shard(0, {"vectors": [[3.0, 0.0, 4.0]], "metadata": [{"text": "old"}]})
+    db.shard_index["counts"]["0"] = 1
+
+    score, meta, _, _ = db.search([3.0, 0.0, 4.0], k=1)[0]
+    assert score == pytest.approx(1.0)
+    assert db.shard_index["normalized"]["0"] is True
+    stored = np.fromfile(db._get_vec_path(0), dtype="float32")
+    assert np.allclose(stored, [0.6, 0.0, 0.8])
+
+def test_hnsw_search_matches_flat():
+    pytest.importorskip("hnswlib")
+    db = LiteVecDB(dim=8, dir_path="testdb", use_hnsw=True)
+    db.delete_all()
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8))
+    for i, vec in enumerate(vectors):
+        db.add(vec.tolist(), {"text": f"item-{i}"})
+
+    score, meta, shard_id, index = db.search(vectors[7].tolist(), k=1)[0]
+    assert meta == {"text": "item-7"}
+    assert (shard_id, index) == (0, 7)
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+    # Graph is persisted on close and reused on reopen
+    db.close()
+    assert os.path.exists(db._hnsw_path())
+    db = LiteVecDB(dim=8, dir_path="testdb", use_hnsw=True)
+    assert db.search(vectors[3].tolist(), k=1)[0][1] == {"text": "item-3"}
+
+    # Deleting shifts offsets, so the graph is rebuilt
+    db.delete(shard_id=0, index=0)
+    assert db.search(vectors[3].tolist(), k=1)[0][1:] == ({"text": "item-3"}, 0, 2)
+    db.close()
+
+def test_topk_indices_partial_sort():
+    from litevecdb.kernels import topk_indices
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert topk_indices(scores, 3).tolist() == [1, 3, 2]
+    assert topk_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert topk_indices(scores, 0).tolist() == []
+
+def test_search_k_zero():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample"})
+    assert db.search([1.0, 2.0, 3.0], k=0) == []
+
+def test_filter_uses_inverted_index():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "a", "location": "Bangkok", "tags": ["x"]})
+    db.add([1.0, 2.0, 3.1], {"text": "b", "location": "Bangkok", "lang": "th"})
+    db.search([1.0, 2.0, 3.0], filters={"location": "Bangkok"})
+    # Rows added after the index is built are indexed too
+    db.add([1.0, 2.0, 3.2], {"text": "c", "location": "Chiang Mai", "lang": "th"})
+
+    assert db._meta_index[0]["location"]["Bangkok"] == [0, 1]
+    assert db._meta_index[0]["lang"]["th"] == [1, 2]
+
+    def texts(filters):
+        return sorted(r[1]["text"] for r in db.search([1.0, 2.0, 3.0], k=5, filters=filters))
+
+    assert texts({"location": "Bangkok", "lang": "th"}) == ["b"]
+    assert texts({"lang": "th"}) == ["b", "c"]
+    assert texts({"location": "Phuket"}) == []
+    # None and unhashable filter values fall back to a scan
+    assert texts({"lang": None}) == ["a"]
+    assert texts({"tags": ["x"]}) == ["a"]
+
+    db.delete(shard_id=0, index=0)
+    assert texts({"location": "Bangkok"}) == ["b"]
+
+def test_search_across_parallel_shards():
+    db = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0001)
+    db.delete_all()
+    for i in range(10):
+        db.add([1.0 * i, 2.0, 3.0], {"text": f"item-{i}"})
+    assert db.shard_index["last_shard"] > 1
+
+    result = db.search([9.0, 2.0, 3.0], k=3)
+    assert [r[1]["text"] for r in result] == ["item-9", "item-8", "item-7"]
+    for score, meta, shard_id, index in result:
+        assert db._load_shard(shard_id)["metadata"][index] == meta
+
+def test_quantized_shard_search():
+    db = LiteVecDB(dim=8, dir_path="testdb", use_quantization=True)
+    db.delete_all()
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 8))
+    for i, vec in enumerate(vectors):
+        db.add(vec.tolist(), {"text": f"item-{i}", "even": i % 2 == 0})
+
+    assert db.shard_index["dtypes"]["0"] == "int8"
+    db.flush()
+    assert os.path.getsize(db._get_vec_path(0)) == 20 * 8
+    assert os.path.getsize(db._get_scale_path(0)) == 20 * 4
+
+    score, meta, shard_id, index = db.search(vectors[5].tolist(), k=1)[0]
+    assert meta["text"] == "item-5"
+    assert score == pytest.approx(1.0, abs=0.02)
+    assert db.search(vectors[5].tolist(), k=1, filters={"even": True})[0][1]["even"]
+
+    db.delete(shard_id=0, index=0)
+    assert os.path.getsize(db._get_scale_path(0)) == 19 * 4
+    stored = np.array(db.get_all()[4]["vector"])
+    expected = vectors[5] / np.linalg.norm(vectors[5])
+    assert np.allclose(stored, expected, atol=0.02)
+
+def test_shard_cache_lru():
+    db = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0001)
+    db.delete_all()
+    for i in range(10):
+        db.add([1.0 * i, 2.0, 3.0], {"text": f"item-{i}"})
+    assert db.shard_index["last_shard"] >= 2
+
+    db.search([1.0, 2.0, 3.0])
+    assert set(db._shard_cache) == set(range(db.shard_index["last_shard"] + 1))
+    # Writes drop the shard from the cache
+    shard_id = db.shard_index["last_shard"]
+    db.add([1.0, 2.0, 3.0], {"text": "new"})
+    assert shard_id not in db._shard_cache
+
+    # Bounded by bytes: evicts least recently used shards
+    _, size = db._shard_cache[0]
+    db.max_cache_size = size
+    db._shard_cache.clear()
+    db._cache_bytes = 0
+    db._load_shard(0)
+    db._load_shard(1)
+    assert list(db._shard_cache) == [1]
+    assert db._cache_bytes <= db.max_cache_size
+
+def test_loaded_vectors_are_contiguous_float32():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+
+    vectors = db._load_shard(0)["vectors"]
+    assert type(vectors) is np.ndarray
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (2, 3)
+    assert vectors.flags["C_CONTIGUOUS"]
+
+def test_int8_topk_kernel_matches_numpy():
+    kernels = pytest.importorskip("litevecdb.kernels")
+    if not kernels.HAS_NUMBA:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(0)
+    vecs, scales = kernels.quantize_int8(rng.normal(size=(300, 24)))
+    q, q_scale = kernels.quantize_int8(rng.normal(size=24))
+
+    idx, scores = kernels.topk_int8(vecs, scales, q, float(q_scale), 4)
+    sim = (vecs.astype(np.int32) @ q.astype(np.int32)) * (scales * q_scale)
+    expected = kernels.topk_indices(sim, 4)
+    assert idx.tolist() == expected.tolist()
+    assert np.allclose(scores, sim[expected], rtol=1e-5)
+
+def test_purge_skips_shards_without_due_expiry(monkeypatch):
+    db = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0001)
+    db.delete_all()
+    for i in range(6):
+        db.add([1.0 * i, 2.0, 3.0], {"text": f"item-{i}"})
+    expiring_shard = db.shard_index["last_shard"]
+    db.add([1.0, 1.0, 1.0], {"text": "temp", "expires_at": time.time() - 1})
+    db.add([1.0, 1.0, 2.0], {"text": "later", "expires_at": time.time() + 3600})
+    assert db.shard_index["min_expiry"]["0"] is None
+
+    loaded = []
+    load_shard = db._load_shard
+    monkeypatch.setattr(db, "_load_shard", lambda shard_id: loaded.append(shard_id) or load_shard(shard_id))
+    db.purge_expired()
+
+    assert loaded == [expiring_shard]
+    remaining = {item["metadata"]["text"]: item["shard"] for item in db.get_all()}
+    assert "temp" not in remaining
+    assert db.shard_index["min_expiry"][str(remaining["later"])] > time.time()
+
+def test_dot_scores_simsimd_matches_numpy():
+    pytest.importorskip("simsimd")
+    from litevecdb.kernels import dot_scores, quantize_int8
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(50, 16)).astype("float32")
+    q = rng.normal(size=16).astype("float32")
+    assert np.allclose(dot_scores(vecs, q), vecs @ q, atol=1e-4)
+
+    vecs_q, _ = quantize_int8(vecs)
+    q_q, _ = quantize_int8(q)
+    assert dot_scores(vecs_q, q_q).tolist() == (vecs_q.astype(np.int32) @ q_q.astype(np.int32)).tolist()
+
+def test_fp16_shard_search():
+    db = LiteVecDB(dim=8, dir_path="testdb", use_fp16=True)
+    db.delete_all()
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 8))
+    for i, vec in enumerate(vectors):
+        db.add(vec.tolist(), {"text": f"item-{i}"})
+
+    assert db.shard_index["dtypes"]["0"] == "float16"
+    db.flush()
+    assert os.path.getsize(db._get_vec_path(0)) == 20 * 8 * 2
+    score, meta, _, _ = db.search(vectors[5].tolist(), k=1)[0]
+    assert meta["text"] == "item-5"
+    assert score == pytest.approx(1.0, abs=1e-2)
+
+    db.delete(shard_id=0, index=0)
+    assert os.path.getsize(db._get_vec_path(0)) == 19 * 8 * 2
+    with pytest.raises(ValueError):
+        LiteVecDB(dim=8, dir_path="testdb", use_fp16=True, use_quantization=True)
+
+def test_index_written_on_flush():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+
+    def saved_counts():
+        with open(db._index_path()) as f:
+            return json.load(f)["counts"]
+
+    assert saved_counts() == {}
+    db.flush()
+    assert saved_counts() == {"0": 2}
+
+    # Counts of rows written without an index flush are recovered from shard file sizes
+    db.add([7.0, 8.0, 9.0], {"text": "sample3"})
+    db._flush_append_files()
+    reopened = LiteVecDB(dim=3, dir_path="testdb")
+    assert reopened.shard_index["counts"] == {"0": 3}
+    assert len(reopened.get_all()) == 3
+
+    with LiteVecDB(dim=3, dir_path="testdb") as ctx:
+        ctx.add([1.0, 1.0, 1.0], {"text": "sample4"})
+    assert saved_counts() == {"0": 4}
+
+def test_adds_buffered_until_flush_every():
+    db = LiteVecDB(dim=3, dir_path="testdb", flush_every=3)
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+    assert os.path.getsize(db._get_vec_path(0)) == 0
+
+    # Reads see buffered rows
+    assert db.search([4.0, 5.0, 6.0], k=1)[0][1] == {"text": "sample2"}
+    assert os.path.getsize(db._get_vec_path(0)) == 2 * 3 * 4
+
+    for i in range(3):
+        db.add([1.0, 1.0, 1.0 * i], {"text": f"more-{i}"})
+    assert os.path.getsize(db._get_vec_path(0)) == 5 * 3 * 4
+    with open(db._index_path()) as f:
+        assert json.load(f)["counts"] == {"0": 5}
+
+def test_returned_metadata_does_not_alias_cache():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample"})
+
+    db.search([1.0, 2.0, 3.0])[0][1]["text"] = "MUTATED"
+    db.get_all()[0]["metadata"]["text"] = "MUTATED"
+    assert db.search([1.0, 2.0, 3.0])[0][1] == {"text": "sample"}
+    assert db.get_all()[0]["metadata"] == {"text": "sample"}
+
+def test_reconcile_truncates_interrupted_flush():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "sample1"})
+    db.close()
+
+    # Vector row written, metadata line not
+    with open(db._get_vec_path(0), "ab") as f:
+        f.write(np.ones(3, dtype="float32").tobytes())
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    assert db.shard_index["counts"]["0"] == 1
+    assert os.path.getsize(db._get_vec_path(0)) == 3 * 4
+    assert db.search([1.0, 1.0, 1.0], k=3)[0][1] == {"text": "sample1"}
+
+    # Metadata line (and a partial one) written, vector row not
+    db.close()
+    with open(db._get_meta_path(0), "a") as f:
+        f.write('{"text": "orphan"}\n{"text": "part')
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    assert db.shard_index["counts"]["0"] == 1
+    assert db._load_metadata(0) == [{"text": "sample1"}]
+    db.add([4.0, 5.0, 6.0], {"text": "sample2"})
+    assert [item["metadata"]["text"] for item in db.get_all()] == ["sample1", "sample2"]
+
+def test_buffered_rows_written_when_collected():
+    import gc
+
+    def ingest():
+        db = LiteVecDB(dim=3, dir_path="testdb")
+        for i in range(5):
+            db.add([1.0, 2.0, 1.0 * i], {"text": f"item-{i}"})
+
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    del db
+    ingest()
+    gc.collect()
+
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    assert len(db.get_all()) == 5
+    db.close()
+    assert not db._exit_hook_registered
+
+def test_periodic_flush_skips_hnsw(monkeypatch):
+    db = LiteVecDB(dim=3, dir_path="testdb", flush_every=2)
+    db.delete_all()
+    saves = []
+    monkeypatch.setattr(db, "_save_hnsw", lambda: saves.append(1))
+    for i in range(6):
+        db.add([1.0, 2.0, 1.0 * i], {"text": f"item-{i}"})
+    assert saves == []
+    assert os.path.getsize(db._get_vec_path(0)) == 6 * 3 * 4
+    db.flush()
+    assert saves == [1]
+
+def test_reassign_after_buffered_adds():
+    import gc
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.close()
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    for i in range(3):
+        db.add([1.0, 0.0, 1.0 * i], {"g": "a"})
+    # The old instance's buffered rows land after the new one has opened the store
+    db = LiteVecDB(dim=3, dir_path="testdb", use_quantization=True)
+    gc.collect()
+    assert len(db.search([1.0, 0.0, 0.0], k=10, filters={"g": "a"})) == 3
+    db.add([0.0, 1.0, 0.0], {"g": "b"})
+    results = db.search([0.0, 1.0, 0.0], k=10, filters={"g": "b"})
+    assert [(r[1], r[3]) for r in results] == [({"g": "b"}, 3)]
+    assert db.shard_index['dtypes'].get('0', 'float32') == 'float32'
+    assert len(db.search([0.0, 1.0, 0.0], k=10)) == 4
+    db.close()
+
+def test_exit_hook_keeps_newer_index():
+    db1 = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0002)
+    db1.delete_all()
+    db1.add([1.0, 2.0, 3.0], {"text": "first"})
+    db2 = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0002)
+    for i in range(20):
+        db2.add([1.0, 2.0, 1.0 * i], {"text": f"item-{i}"})
+    last_shard = db2.shard_index['last_shard']
+    assert last_shard >= 2
+    db2.close()
+
+    # Interpreter exit with db1 still alive must not roll back db2's index
+    db1._exit_hook()
+    db = LiteVecDB(dim=3, dir_path="testdb", max_shard_size_mb=0.0002)
+    assert db.shard_index['last_shard'] == last_shard
+    assert len(db.get_all()) == 21
+    db.close()
+    del db1
+
+def test_delete_missing_shard_changes_nothing():
+    db = LiteVecDB(dim=3, dir_path="testdb")
+    db.delete_all()
+    db.add([1.0, 2.0, 3.0], {"text": "only"})
+    with pytest.raises(IndexError):
+        db.delete(7, 0)
+    assert '7' not in db.shard_index['normalized']
+    assert 7 not in db._shard_cache
+    assert not os.path.exists(db._get_vec_path(7))
+    db.close()